@@ -1,18 +1,22 @@
 """
 麦生育マップ - GitHub Actions自動更新版 (キャッシュ機構搭載)
 NDVI、NDWI、GNDVI の3つのマップを作成
-各日付のデータをGeoJSONキャッシュとして保存し、新規日付のみ処理
+各日付のピクセルをParquetストアに保存し、新規日付のみ処理
 """
 
 import ee
 import pandas as pd
 import folium
-from folium import FeatureGroup
+from folium.plugins import TimestampedGeoJson
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
+import gzip
 import datetime as dt
-import json
+import orjson
 import argparse
+import multiprocessing
 
 # ===== 引数パース =====
 parser = argparse.ArgumentParser()
@@ -21,12 +25,17 @@ parser.add_argument('--force-rebuild', action='store_true', help='全データ
 args = parser.parse_args()
 
 # ===== Earth Engine初期化（サービスアカウント） =====
-try:
+def init_ee():
+    """EEクライアントを初期化（大量取得向けhigh-volumeエンドポイント使用）"""
     credentials = ee.ServiceAccountCredentials(
         email=os.environ.get('GEE_SERVICE_ACCOUNT'),
         key_file='private-key.json'
     )
-    ee.Initialize(credentials, project='ee-kitsukisaiseikyo')
+    ee.Initialize(credentials, project='ee-kitsukisaiseikyo',
+                  opt_url='https://earthengine-highvolume.googleapis.com')
+
+try:
+    init_ee()
 except Exception as e:
     print(f"GEE初期化エラー: {e}")
     exit(1)
@@ -40,15 +49,64 @@ FIELD_ASSET = 'projects/ee-kitsukisaiseikyo/assets/2025442101'
 TARGET_FIELDS_PATH = '新庄麦筆リスト.xlsx'
 OUTPUT_DIR = 'output'
 CACHE_DIR = os.path.join(OUTPUT_DIR, 'cache')
+PIXEL_STORE_DIR = os.path.join(CACHE_DIR, 'pixels')
 STATE_FILE = 'last_processed.txt'
 
 START_DATE = '2024-12-01'
 END_DATE = dt.datetime.now().strftime('%Y-%m-%d')
 PIXEL_SCALE = 10
+HALF_SIZE_DEG = PIXEL_SCALE / 2 / 111320  # ピクセル矩形の半辺（度）
+RUN_MERGE_GAP_DEG = HALF_SIZE_DEG * 3  # この間隔を超えたら同一行でもランを分割
 CLOUD_THRESHOLD = 50
+MAX_WORKERS = 25
+SAMPLE_TILE_SCALE = 4  # sampleRegionsの分散度（タイムアウトする場合は8へ）
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(PIXEL_STORE_DIR, exist_ok=True)
+
+# ===== ピクセルキャッシュ入出力 =====
+# 日付ごとのピクセルはParquetの列指向ストア（date=YYYY-MM-DDパーティション）に保存。
+# 旧形式の日付別JSONキャッシュは読み込み時のみフォールバックとして扱う。
+PIXEL_COLUMNS = ('polygon_uu', 'lon', 'lat', 'ndvi', 'ndwi', 'gndvi')
+
+def date_cached(date_str):
+    """日付のピクセルデータが保存済みか（Parquet優先、旧JSONも可）"""
+    return (os.path.isdir(os.path.join(PIXEL_STORE_DIR, f'date={date_str}'))
+            or os.path.exists(os.path.join(CACHE_DIR, f'{date_str}.json')))
+
+def write_date_pixels(date_str, cols):
+    """1日付分のピクセル列をParquetパーティションとして保存（再実行時は上書き）"""
+    part_dir = os.path.join(PIXEL_STORE_DIR, f'date={date_str}')
+    os.makedirs(part_dir, exist_ok=True)
+    pq.write_table(pa.Table.from_pydict(cols), os.path.join(part_dir, 'part-0.parquet'))
+
+def load_date_pixels(date_str):
+    """1日付分のピクセル列を読み込む。Parquetがなければ旧JSONキャッシュから変換"""
+    part_dir = os.path.join(PIXEL_STORE_DIR, f'date={date_str}')
+    if os.path.isdir(part_dir):
+        return pq.read_table(part_dir).to_pydict()
+
+    cache_file = os.path.join(CACHE_DIR, f'{date_str}.json')
+    if not os.path.exists(cache_file):
+        return None
+
+    with open(cache_file, 'rb') as f:
+        date_cache = orjson.loads(f.read())
+
+    cols = {col: [] for col in PIXEL_COLUMNS}
+    for field_data in date_cache['fields']:
+        for p in field_data['pixels']:
+            # 旧キャッシュに残る全指標欠損ピクセルは読み込まない
+            if p['ndvi'] is None and p['ndwi'] is None and p['gndvi'] is None:
+                continue
+            cols['polygon_uu'].append(field_data['polygon_uu'])
+            cols['lon'].append(p['lon'])
+            cols['lat'].append(p['lat'])
+            cols['ndvi'].append(p['ndvi'])
+            cols['ndwi'].append(p['ndwi'])
+            cols['gndvi'].append(p['gndvi'])
+    return cols
 
 print(f"\n前回処理日: {args.last_date}")
 print(f"検索期間: {args.last_date} 〜 {END_DATE}")
@@ -58,7 +116,10 @@ if args.force_rebuild:
 
 # ===== データ読み込み =====
 print("\n[1] データ読み込み中...")
-target_fields_df = pd.read_excel(TARGET_FIELDS_PATH)
+# polygon_uuをインデックスにして属性参照をO(1)に（.at[uu, col]で引ける）
+target_fields_df = pd.read_excel(TARGET_FIELDS_PATH).set_index('polygon_uu', drop=False)
+assert target_fields_df.index.is_unique, 'polygon_uuが重複しています'
+addr_by_uu = target_fields_df['address'].to_dict()
 print(f"  ✓ 対象筆数: {len(target_fields_df)}筆")
 
 field_polygons = ee.FeatureCollection(FIELD_ASSET)
@@ -71,7 +132,9 @@ print("\n[2] Sentinel-2画像検索中...")
 def mask_s2_clouds(image):
     qa = image.select('QA60')
     mask = qa.bitwiseAnd(1 << 10).eq(0).And(qa.bitwiseAnd(1 << 11).eq(0))
-    return image.updateMask(mask).divide(10000)
+    # 反射率スケーリング(divide(10000))は正規化指数 (A-B)/(A+B) に影響しないため
+    # 省略し、サーバー側の全バンド中間画像を1段減らす
+    return image.updateMask(mask)
 
 def add_indices(image):
     ndvi = image.normalizedDifference(['B8', 'B4']).rename('NDVI')
@@ -87,7 +150,9 @@ s2_collection = (ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED')
     .map(add_indices)
 )
 
-image_count = s2_collection.size().getInfo()
+# サイズ取得と全メタデータ取得の2往復を、system:indexの1回取得に集約
+scene_indices = s2_collection.aggregate_array('system:index').getInfo()
+image_count = len(scene_indices)
 print(f"  ✓ 検索画像数: {image_count}枚")
 
 if image_count == 0 and not args.force_rebuild:
@@ -99,8 +164,8 @@ print("\n[3] 履歴データ読み込み中...")
 
 history_file = os.path.join(OUTPUT_DIR, 'observation_history.json')
 if os.path.exists(history_file):
-    with open(history_file, 'r', encoding='utf-8') as f:
-        history = json.load(f)
+    with open(history_file, 'rb') as f:
+        history = orjson.loads(f.read())
     print(f"  ✓ 既存観測日数: {len(history['dates'])}日")
 else:
     history = {
@@ -113,14 +178,9 @@ else:
 # ===== 観測日取得 =====
 print("\n[4] 観測日取得中...")
 
-collection_info = s2_collection.getInfo()
 all_dates_from_gee = {}
 
-for feature in collection_info.get('features', []):
-    props = feature.get('properties', {})
-    if 'system:index' not in props:
-        continue
-    idx = props['system:index']
+for idx in scene_indices:
     date_obj = dt.datetime.strptime(idx[:8], '%Y%m%d')
     date_str = date_obj.strftime('%Y-%m-%d')
     all_dates_from_gee[date_str] = idx
@@ -130,9 +190,7 @@ new_dates = []
 existing_dates = []
 
 for date_str, idx in sorted(all_dates_from_gee.items()):
-    cache_file = os.path.join(CACHE_DIR, f'{date_str}.json')
-    
-    if args.force_rebuild or not os.path.exists(cache_file):
+    if args.force_rebuild or not date_cached(date_str):
         new_dates.append(date_str)
         history['date_to_index'][date_str] = idx
     else:
@@ -151,133 +209,162 @@ if len(new_dates) == 0 and not args.force_rebuild:
 print("\n[5] 筆ポリゴン情報取得中...")
 fields_info = target_polygons.getInfo()
 coords = target_polygons.geometry().bounds().getInfo()['coordinates'][0]
-center_lon = sum([c[0] for c in coords]) / len(coords)
-center_lat = sum([c[1] for c in coords]) / len(coords)
+center_lon, center_lat = np.asarray(coords).mean(axis=0)
 print(f"  ✓ マップ中心: ({center_lat:.4f}, {center_lon:.4f})")
 
-# ===== カラーマップ関数 =====
-def get_ndvi_color(ndvi):
-    if ndvi is None or np.isnan(ndvi):
-        return '#808080'
-    if ndvi < 0.2:
-        return '#d73027'
-    if ndvi < 0.4:
-        return '#fc8d59'
-    if ndvi < 0.6:
-        return '#fee08b'
-    if ndvi < 0.8:
-        return '#91cf60'
-    return '#1a9850'
-
-def get_ndwi_color(ndwi):
-    if ndwi is None or np.isnan(ndwi):
-        return '#808080'
-    if ndwi < -0.3:
-        return '#8B4513'
-    if ndwi < -0.1:
-        return '#D2691E'
-    if ndwi < 0.1:
-        return '#F4A460'
-    if ndwi < 0.3:
-        return '#87CEEB'
-    return '#4169E1'
-
-def get_gndvi_color(gndvi):
-    if gndvi is None or np.isnan(gndvi):
-        return '#808080'
-    if gndvi < 0.2:
-        return '#FFFF00'
-    if gndvi < 0.4:
-        return '#9ACD32'
-    if gndvi < 0.6:
-        return '#32CD32'
-    if gndvi < 0.8:
-        return '#228B22'
-    return '#006400'
+# ===== カラーマップ =====
+NDVI_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.8])
+NDVI_PALETTE = np.array(['#d73027', '#fc8d59', '#fee08b', '#91cf60', '#1a9850'])
+
+NDWI_THRESHOLDS = np.array([-0.3, -0.1, 0.1, 0.3])
+NDWI_PALETTE = np.array(['#8B4513', '#D2691E', '#F4A460', '#87CEEB', '#4169E1'])
+
+GNDVI_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.8])
+GNDVI_PALETTE = np.array(['#FFFF00', '#9ACD32', '#32CD32', '#228B22', '#006400'])
+
+NODATA_COLOR = '#808080'
+
+def classify_colors(values, thresholds, palette):
+    """指標値のfloat配列をまとめて色分類（NaNは灰色）
+
+    None→NaNの変換は列の読み込み側で済ませておくこと。
+    """
+    arr = np.asarray(values, dtype=np.float64)
+    # searchsortedはNaNを最大値扱いするため、いったんパレット末尾に落ちてから灰色へ置換
+    idx = np.searchsorted(thresholds, arr, side='right')
+    return np.where(np.isnan(arr), NODATA_COLOR, palette[idx])
+
+# ===== ピクセルレイヤー構築 =====
+def pixel_geojson_feature(geometry, address, date, label, value, color, count=1):
+    """1ラン（1ピクセル以上）分の時刻付きGeoJSON Featureを作成"""
+    value_str = f"{value:.3f}" if value is not None and not np.isnan(value) else 'N/A'
+    if count > 1:
+        value_str = f"{value_str}（{count}px平均）"
+    return {
+        'type': 'Feature',
+        'geometry': geometry,
+        'properties': {
+            'times': [date],
+            'style': {
+                'color': color,
+                'fillColor': color,
+                'fillOpacity': 0.8,
+                'weight': 0.5
+            },
+            'popup': f"<b>{address}</b><br>日付: {date}<br>{label}: {value_str}"
+        }
+    }
+
+def merge_pixel_runs(lons, lats, uu_codes, colors):
+    """同一筆・同一行・同一色クラスの隣接ピクセルをランへ統合する。
+
+    行（緯度ビン）→経度の順に並べ替え、筆・行・色が変わるか経度が
+    飛んだ位置でランを区切る。並べ替えインデックスと(開始, 終了)の
+    組のリストを返す。
+    """
+    rows = np.round(lats / (2 * HALF_SIZE_DEG)).astype(np.int64)
+    order = np.lexsort((lons, rows, uu_codes))
+    if len(order) == 0:
+        return order, []
+
+    s_lon = lons[order]
+    s_row = rows[order]
+    s_uu = uu_codes[order]
+    s_color = colors[order]
+
+    breaks = ((np.diff(s_uu) != 0)
+              | (np.diff(s_row) != 0)
+              | (s_color[1:] != s_color[:-1])
+              | (np.diff(s_lon) > RUN_MERGE_GAP_DEG))
+    starts = np.concatenate(([0], np.flatnonzero(breaks) + 1))
+    ends = np.concatenate((starts[1:], [len(order)]))
+    return order, list(zip(starts, ends))
+
+def add_time_layer(features, m):
+    """全日付のピクセルを1つのタイムスライダー付きレイヤーとして追加"""
+    TimestampedGeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        period='P1D',
+        duration='P1D',
+        transition_time=200,
+        add_last_point=False
+    ).add_to(m)
 
 # ===== 新規日付の処理とキャッシュ生成 =====
 print("\n[6] 新規日付処理中...")
 
-for date_idx, date in enumerate(new_dates):
-    print(f"\n  === [{date_idx+1}/{len(new_dates)}] {date} 処理中 ===")
-    
+# system:index → ee.Image の対応を1回だけ構築（日付ごとの全コレクション再フィルタを排除）
+image_list = s2_collection.toList(image_count)
+image_by_index = {idx: ee.Image(image_list.get(i)) for i, idx in enumerate(scene_indices)}
+
+def fetch_date(date):
+    """1日付分の全筆ピクセルをサンプリングし、列形式で返す（ワーカープロセスで実行）"""
     target_index = history['date_to_index'][date]
-    target_image = s2_collection.filter(ee.Filter.eq('system:index', target_index)).first()
-    
-    # 日付ごとのGeoJSONデータ
-    date_cache = {
-        'date': date,
-        'fields': []
-    }
-    
-    date_pixels = 0
-    
-    for field_idx, feature in enumerate(fields_info['features']):
-        if feature['geometry']['type'] != 'Polygon':
+    target_image = image_by_index[target_index]
+
+    # 全筆をまとめて1回のsampleRegionsでサンプリング（筆ごとの往復を排除）
+    try:
+        sample_data = target_image.select(['NDVI', 'NDWI', 'GNDVI']).sampleRegions(
+            collection=target_polygons,
+            properties=['polygon_uu'],
+            scale=PIXEL_SCALE,
+            tileScale=SAMPLE_TILE_SCALE,
+            geometries=True
+        ).getInfo()
+    except Exception as e:
+        print(f"  エラー ({date}): {e}")
+        return date, None
+
+    cols = {col: [] for col in PIXEL_COLUMNS}
+    for pixel_feature in sample_data.get('features', []):
+        geom = pixel_feature.get('geometry', {})
+        props = pixel_feature.get('properties', {})
+        if not geom or not props:
             continue
-        
-        polygon_uu = feature['properties'].get('polygon_uu')
-        address = target_fields_df[target_fields_df['polygon_uu'] == polygon_uu]['address'].values
-        address = address[0] if len(address) > 0 else '不明'
-        
-        print(f"    [{field_idx+1}/{len(fields_info['features'])}] {address}...", end='', flush=True)
-        
-        field_geom = ee.Geometry.Polygon(feature['geometry']['coordinates'])
-        
-        try:
-            sample_data = target_image.select(['NDVI', 'NDWI', 'GNDVI']).sample(
-                region=field_geom,
-                scale=PIXEL_SCALE,
-                geometries=True
-            ).getInfo()
-            
-            if 'features' not in sample_data:
-                print(" データなし")
-                continue
-            
-            pixel_count = len(sample_data['features'])
-            
-            # 圃場データをキャッシュに保存
-            field_data = {
-                'polygon_uu': polygon_uu,
-                'address': address,
-                'boundary': feature['geometry']['coordinates'][0],
-                'pixels': []
-            }
-            
-            for pixel_feature in sample_data['features']:
-                geom = pixel_feature.get('geometry', {})
-                props = pixel_feature.get('properties', {})
-                if not geom or not props:
-                    continue
-                
-                lon, lat = geom['coordinates']
-                field_data['pixels'].append({
-                    'lat': lat,
-                    'lon': lon,
-                    'ndvi': props.get('NDVI'),
-                    'ndwi': props.get('NDWI'),
-                    'gndvi': props.get('GNDVI')
-                })
-            
-            date_cache['fields'].append(field_data)
-            date_pixels += pixel_count
-            print(f" {pixel_count}px")
-            
-        except Exception as e:
-            print(f" エラー: {e}")
+
+        ndvi = props.get('NDVI')
+        ndwi = props.get('NDWI')
+        gndvi = props.get('GNDVI')
+
+        # 雲マスクされたピクセルは全指標が欠損になるため、ここで間引く
+        if ndvi is None and ndwi is None and gndvi is None:
             continue
-    
-    # キャッシュファイル保存
-    cache_file = os.path.join(CACHE_DIR, f'{date}.json')
-    with open(cache_file, 'w', encoding='utf-8') as f:
-        json.dump(date_cache, f, ensure_ascii=False, indent=2)
-    
+
+        lon, lat = geom['coordinates']
+        cols['polygon_uu'].append(props.get('polygon_uu'))
+        cols['lon'].append(lon)
+        cols['lat'].append(lat)
+        cols['ndvi'].append(ndvi)
+        cols['ndwi'].append(ndwi)
+        cols['gndvi'].append(gndvi)
+
+    return date, cols
+
+# 日付単位で並列ダウンロード（EEクライアントはfork非対応のためワーカー内で再初期化）
+# 本スクリプトは__main__ガードのないフラット構成のため、spawn/forkserverでは
+# ワーカーがスクリプト全体を再実行してしまう。fork開始方式を明示的に固定する。
+if new_dates:
+    worker_count = min(MAX_WORKERS, len(new_dates))
+    print(f"  並列ダウンロード開始: {len(new_dates)}日 / {worker_count}ワーカー")
+    with multiprocessing.get_context('fork').Pool(worker_count, initializer=init_ee) as pool:
+        fetch_results = pool.map(fetch_date, new_dates)
+else:
+    fetch_results = []
+
+for date, cols in fetch_results:
+    if cols is None:
+        print(f"  ⚠️ {date}: 取得失敗")
+        continue
+
+    # Parquetサイドカーへ保存
+    write_date_pixels(date, cols)
+
+    date_pixels = len(cols['lon'])
     if date not in history['dates']:
         history['dates'].append(date)
     history['pixel_counts'][date] = date_pixels
-    
-    print(f"  ✓ {date}: {date_pixels}ピクセル (キャッシュ保存)")
+
+    print(f"  ✓ {date}: {date_pixels}ピクセル (Parquet保存)")
 
 # ===== マップ構築（全日付のキャッシュから） =====
 print("\n[7] マップ構築中...")
@@ -286,130 +373,97 @@ m_ndvi = folium.Map(location=[center_lat, center_lon], zoom_start=15, tiles='Ope
 m_ndwi = folium.Map(location=[center_lat, center_lon], zoom_start=15, tiles='OpenStreetMap')
 m_gndvi = folium.Map(location=[center_lat, center_lon], zoom_start=15, tiles='OpenStreetMap')
 
+# 筆境界線（日付に依存しないため、各マップに1つのGeoJsonレイヤーとして追加）
+boundary_fc = {
+    'type': 'FeatureCollection',
+    'features': [
+        {'type': 'Feature', 'geometry': f['geometry'], 'properties': {}}
+        for f in fields_info['features']
+        if f['geometry']['type'] == 'Polygon'
+    ]
+}
+for m in (m_ndvi, m_ndwi, m_gndvi):
+    folium.GeoJson(
+        boundary_fc,
+        name='筆境界',
+        style_function=lambda f: {'color': '#000000', 'weight': 2, 'fill': False}
+    ).add_to(m)
+
 all_dates = sorted(history['dates'])
 total_pixels = 0
 
+# 全日付を指標ごとに1つの時系列FeatureCollectionへ集約
+# （日付ごとのFeatureGroup×LayerControlチェックボックスを廃止）
+features_ndvi = []
+features_ndwi = []
+features_gndvi = []
+
 for date_idx, date in enumerate(all_dates):
-    cache_file = os.path.join(CACHE_DIR, f'{date}.json')
-    
-    if not os.path.exists(cache_file):
+    cols = load_date_pixels(date)
+    if cols is None:
         print(f"  ⚠️ キャッシュなし: {date}")
         continue
-    
+
     print(f"  [{date_idx+1}/{len(all_dates)}] {date} 読み込み中...", end='', flush=True)
-    
-    with open(cache_file, 'r', encoding='utf-8') as f:
-        date_cache = json.load(f)
-    
-    # レイヤー作成（最新日付のみ表示）
-    show_layer = (date == all_dates[-1])
-    layer_ndvi = FeatureGroup(name=f'NDVI_{date}', show=show_layer)
-    layer_ndwi = FeatureGroup(name=f'NDWI_{date}', show=show_layer)
-    layer_gndvi = FeatureGroup(name=f'GNDVI_{date}', show=show_layer)
-    
-    date_pixel_count = 0
-    
-    for field_data in date_cache['fields']:
-        address = field_data['address']
-        
-        # ピクセル描画
-        for pixel in field_data['pixels']:
-            lat = pixel['lat']
-            lon = pixel['lon']
-            ndvi = pixel['ndvi']
-            ndwi = pixel['ndwi']
-            gndvi = pixel['gndvi']
-            
-            half_size = PIXEL_SCALE / 2 / 111320
-            bounds = [[lat - half_size, lon - half_size], [lat + half_size, lon + half_size]]
-            
-            # NDVI
-            ndvi_str = f"{ndvi:.3f}" if ndvi is not None and not np.isnan(ndvi) else 'N/A'
-            folium.Rectangle(
-                bounds=bounds,
-                color=get_ndvi_color(ndvi),
-                fill=True,
-                fillColor=get_ndvi_color(ndvi),
-                fillOpacity=0.8,
-                weight=0.5,
-                popup=f"<b>{address}</b><br>日付: {date}<br>NDVI: {ndvi_str}",
-                tooltip=f"{date}: NDVI {ndvi_str}"
-            ).add_to(layer_ndvi)
-            
-            # NDWI
-            ndwi_str = f"{ndwi:.3f}" if ndwi is not None and not np.isnan(ndwi) else 'N/A'
-            folium.Rectangle(
-                bounds=bounds,
-                color=get_ndwi_color(ndwi),
-                fill=True,
-                fillColor=get_ndwi_color(ndwi),
-                fillOpacity=0.8,
-                weight=0.5,
-                popup=f"<b>{address}</b><br>日付: {date}<br>NDWI: {ndwi_str}",
-                tooltip=f"{date}: NDWI {ndwi_str}"
-            ).add_to(layer_ndwi)
-            
-            # GNDVI
-            gndvi_str = f"{gndvi:.3f}" if gndvi is not None and not np.isnan(gndvi) else 'N/A'
-            folium.Rectangle(
-                bounds=bounds,
-                color=get_gndvi_color(gndvi),
-                fill=True,
-                fillColor=get_gndvi_color(gndvi),
-                fillOpacity=0.8,
-                weight=0.5,
-                popup=f"<b>{address}</b><br>日付: {date}<br>GNDVI: {gndvi_str}",
-                tooltip=f"{date}: GNDVI {gndvi_str}"
-            ).add_to(layer_gndvi)
-            
-            date_pixel_count += 1
-        
-        # 筆境界線
-        coords_poly = [[lat, lon] for lon, lat in field_data['boundary']]
-        folium.Polygon(coords_poly, color='#000000', weight=2, fill=False).add_to(layer_ndvi)
-        folium.Polygon(coords_poly, color='#000000', weight=2, fill=False).add_to(layer_ndwi)
-        folium.Polygon(coords_poly, color='#000000', weight=2, fill=False).add_to(layer_gndvi)
-    
-    layer_ndvi.add_to(m_ndvi)
-    layer_ndwi.add_to(m_ndwi)
-    layer_gndvi.add_to(m_gndvi)
-    
-    total_pixels += date_pixel_count
-    print(f" {date_pixel_count}px")
+
+    lons = np.asarray(cols['lon'], dtype=np.float64)
+    lats = np.asarray(cols['lat'], dtype=np.float64)
+    uu_arr = np.asarray(cols['polygon_uu'], dtype=object)
+    uu_codes = np.unique(uu_arr, return_inverse=True)[1] if len(uu_arr) else np.array([], dtype=np.int64)
+
+    # 日付内の全ピクセルをまとめて色分類
+    ndvi_vals = np.array([np.nan if v is None else v for v in cols['ndvi']], dtype=np.float64)
+    ndwi_vals = np.array([np.nan if v is None else v for v in cols['ndwi']], dtype=np.float64)
+    gndvi_vals = np.array([np.nan if v is None else v for v in cols['gndvi']], dtype=np.float64)
+    ndvi_colors = classify_colors(ndvi_vals, NDVI_THRESHOLDS, NDVI_PALETTE)
+    ndwi_colors = classify_colors(ndwi_vals, NDWI_THRESHOLDS, NDWI_PALETTE)
+    gndvi_colors = classify_colors(gndvi_vals, GNDVI_THRESHOLDS, GNDVI_PALETTE)
+
+    date_run_count = 0
+
+    # 同一色クラスの隣接ピクセルをランへ統合して描画（DOMノード数を削減）
+    for label, values, colors, features in (
+            ('NDVI', ndvi_vals, ndvi_colors, features_ndvi),
+            ('NDWI', ndwi_vals, ndwi_colors, features_ndwi),
+            ('GNDVI', gndvi_vals, gndvi_colors, features_gndvi)):
+        order, runs = merge_pixel_runs(lons, lats, uu_codes, colors)
+        s_lon = lons[order]
+        s_lat = lats[order]
+        s_val = values[order]
+        s_color = colors[order]
+        s_uu = uu_arr[order]
+
+        for start, end in runs:
+            x0 = s_lon[start] - HALF_SIZE_DEG
+            x1 = s_lon[end - 1] + HALF_SIZE_DEG
+            lat_center = s_lat[start:end].mean()
+            y0 = lat_center - HALF_SIZE_DEG
+            y1 = lat_center + HALF_SIZE_DEG
+            ring = [[x0, y0], [x1, y0], [x1, y1], [x0, y1], [x0, y0]]
+            geometry = {'type': 'Polygon', 'coordinates': [ring]}
+
+            valid = s_val[start:end]
+            valid = valid[~np.isnan(valid)]
+            mean_val = float(valid.mean()) if valid.size else None
+
+            features.append(pixel_geojson_feature(
+                geometry, addr_by_uu.get(s_uu[start], '不明'), date,
+                label, mean_val, s_color[start], count=end - start))
+            date_run_count += 1
+
+    total_pixels += len(lons)
+    print(f" {len(lons)}px → {date_run_count}ラン")
+
+# タイムスライダー付きレイヤーとして各マップへ追加
+add_time_layer(features_ndvi, m_ndvi)
+add_time_layer(features_ndwi, m_ndwi)
+add_time_layer(features_gndvi, m_gndvi)
 
 # ===== LayerControl追加 =====
 folium.LayerControl(position='topright', collapsed=False).add_to(m_ndvi)
 folium.LayerControl(position='topright', collapsed=False).add_to(m_ndwi)
 folium.LayerControl(position='topright', collapsed=False).add_to(m_gndvi)
 
-# ===== レイヤー操作ボタン =====
-layer_control_script = '''
-<div id="layerButtons" style="position: fixed; bottom: 10px; right: 10px; z-index: 1000;
-    background: white; padding: 8px; border-radius: 8px; box-shadow: 0 2px 6px rgba(0,0,0,0.3);">
-  <button onclick="selectAllLayers()" style="display: block; width: 100%; margin-bottom: 4px;
-    padding: 6px 12px; font-size: 13px; background: #3498db; color: white; border: none;
-    border-radius: 4px; cursor: pointer;">全選択</button>
-  <button onclick="deselectAllLayers()" style="display: block; width: 100%;
-    padding: 6px 12px; font-size: 13px; background: #95a5a6; color: white; border: none;
-    border-radius: 4px; cursor: pointer;">全解除</button>
-</div>
-<script>
-function selectAllLayers() {
-  document.querySelectorAll('.leaflet-control-layers-selector').forEach(cb => {
-    if (!cb.checked) cb.click();
-  });
-}
-function deselectAllLayers() {
-  document.querySelectorAll('.leaflet-control-layers-selector').forEach(cb => {
-    if (cb.checked) cb.click();
-  });
-}
-</script>
-'''
-m_ndvi.get_root().html.add_child(folium.Element(layer_control_script))
-m_ndwi.get_root().html.add_child(folium.Element(layer_control_script))
-m_gndvi.get_root().html.add_child(folium.Element(layer_control_script))
-
 # ===== タイトル・凡例追加（省略：元のコードと同じ） =====
 # [タイトルと凡例のコードは元のコードをそのまま使用]
 # ===== タイトル =====
@@ -654,17 +708,24 @@ m_gndvi.get_root().html.add_child(folium.Element(legend_gndvi))
 # ===== 保存 =====
 print("\n[8] マップ保存中...")
 
-m_ndvi.save(os.path.join(OUTPUT_DIR, 'index.html'))
-m_ndwi.save(os.path.join(OUTPUT_DIR, 'ndwi.html'))
-m_gndvi.save(os.path.join(OUTPUT_DIR, 'gndvi.html'))
-
-print(f"  ✓ NDVIマップ: index.html")
-print(f"  ✓ NDWIマップ: ndwi.html")
-print(f"  ✓ GNDVIマップ: gndvi.html")
+for m, filename, label in [
+    (m_ndvi, 'index.html', 'NDVIマップ'),
+    (m_ndwi, 'ndwi.html', 'NDWIマップ'),
+    (m_gndvi, 'gndvi.html', 'GNDVIマップ')
+]:
+    map_path = os.path.join(OUTPUT_DIR, filename)
+    # save()を介さず1回のrenderから平文と.gzの両方を書き出す
+    # （ファイル再読込なし、GitHub Pagesは事前圧縮済みアセットを配信できる）
+    html = m.get_root().render()
+    with open(map_path, 'w', encoding='utf-8', buffering=1024 * 1024) as f:
+        f.write(html)
+    with gzip.open(map_path + '.gz', 'wb', compresslevel=6) as f:
+        f.write(html.encode('utf-8'))
+    print(f"  ✓ {label}: {filename} (+ .gz)")
 
 # ===== 履歴保存 =====
-with open(history_file, 'w', encoding='utf-8') as f:
-    json.dump(history, f, ensure_ascii=False, indent=2)
+with open(history_file, 'wb') as f:
+    f.write(orjson.dumps(history, option=orjson.OPT_INDENT_2))
 
 if new_dates:
     with open(STATE_FILE, 'w') as f: